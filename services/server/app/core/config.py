@@ -1,6 +1,7 @@
-from functools import lru_cache
-from typing import List
+from functools import cached_property
+from typing import Literal, Tuple
 
+from pydantic import computed_field
 from pydantic_settings import BaseSettings
 
 
@@ -13,22 +14,48 @@ class Settings(BaseSettings):
     # CORS Settings
     cors_origins_str: str = "http://localhost:3000,http://localhost:5173"
     
-    @property
-    def cors_origins(self) -> List[str]:
-        return [origin.strip() for origin in self.cors_origins_str.split(',')]
+    @computed_field
+    @cached_property
+    def cors_origins(self) -> Tuple[str, ...]:
+        return tuple(origin.strip() for origin in self.cors_origins_str.split(','))
     
     # OpenAI Settings
     openai_model: str = "gpt-4o-mini"
     openai_api_key: str = ""
+    llm_cache_enabled: bool = True
+    llm_cache_disk_enabled: bool = False
+    llm_cache_max_entries: int = 10000
+    # Per-process OpenAI budgets enforced client-side (0 disables the limit)
+    openai_rpm_limit: int = 0
+    openai_tpm_limit: int = 0
+    # Completion tokens reserved per call before the real usage is known; the reservation is
+    # settled against the reported usage afterwards, so this only needs to be typical, not a bound
+    openai_completion_token_estimate: int = 500
     
     # Pinecone Settings
     pinecone_index_name: str = "ai-powered-chatbot-challenge"
+    pinecone_index_host: str = ""
     pinecone_environment: str = "us-east-1"
     pinecone_api_key: str = ""
     
     # RAG Settings
     similarity_threshold: float = 0.7
     top_k_results: int = 3
+    # In-process retrieval LRU; off by default because entries never expire, so a long-running
+    # server would not see index updates. The optimizer turns it on for its evaluation passes.
+    retriever_cache_size: int = 0
+    # Optimizer only: shrink top_k toward the number of hits that actually clear the threshold.
+    # The estimate is per retriever, so the shared API server retriever never enables it.
+    retriever_adaptive_top_k: bool = False
+    # Persist retrieval results on disk across optimizer runs (never used by the API server)
+    pinecone_retriever_cache: bool = False
+    pinecone_retriever_cache_dir: str = ".cache/pinecone"
+    pinecone_retriever_cache_ttl_seconds: int = 86400  # 0 keeps entries until the directory is cleared
+
+    # Response Cache Settings
+    cache_mode: Literal["enabled", "replay", "write_only", "disabled"] = "enabled"
+    cache_ttl_seconds: int = 3600
+    cache_max_entries: int = 1024
     
     # Server Settings
     host: str = "0.0.0.0"
@@ -41,9 +68,8 @@ class Settings(BaseSettings):
         case_sensitive = False
 
 
-@lru_cache()
-def get_settings() -> Settings:
-    return Settings()
+settings = Settings()
 
 
-settings = get_settings()
\ No newline at end of file
+def get_settings() -> Settings:
+    return settings
\ No newline at end of file
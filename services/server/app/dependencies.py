@@ -1,6 +1,25 @@
-from app.services.rag_service import get_rag_service, RAGService
+from fastapi import HTTPException, Request
+from openai import OpenAI
 
+from app.services.rag_service import RAGService
+from app.services.rate_limiter import AsyncTokenBucket
 
-def get_rag_service_dependency() -> RAGService:
-    """Dependency to get RAG service instance"""
-    return get_rag_service()
\ No newline at end of file
+
+async def get_rag_service_dependency(request: Request) -> RAGService:
+    """Dependency to get RAG service instance; 503 while it is loading or if loading failed"""
+    task = request.app.state.rag_service_task
+    if not task.done():
+        raise HTTPException(status_code=503, detail="RAG service is starting up", headers={"Retry-After": "5"})
+    if task.cancelled() or task.exception() is not None:
+        raise HTTPException(status_code=503, detail="RAG service failed to initialize")
+    return task.result()
+
+
+def get_openai_client(request: Request) -> OpenAI:
+    """Dependency to get the shared OpenAI client"""
+    return request.app.state.openai_client
+
+
+def get_openai_rate_limiter(request: Request) -> AsyncTokenBucket:
+    """Dependency to get the shared OpenAI rate limiter"""
+    return request.app.state.openai_rate_limiter
\ No newline at end of file
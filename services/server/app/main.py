@@ -1,16 +1,55 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from openai import OpenAI
 
 from app.core.config import settings
 from app.routers import chat, health
+from app.services.rag_service import get_rag_service
+from app.services.rate_limiter import AsyncTokenBucket
 
 load_dotenv(".env")
 
+logger = logging.getLogger(__name__)
+
+
+def _log_rag_service_failure(task: asyncio.Task) -> None:
+    """Report a failed background load at boot instead of on the first chat request"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("RAG service failed to initialize", exc_info=task.exception())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize shared services once at startup"""
+    app.state.openai_client = OpenAI()
+    # One budget shared by every OpenAI caller in this process
+    app.state.openai_rate_limiter = AsyncTokenBucket(
+        rpm=settings.openai_rpm_limit, tpm=settings.openai_tpm_limit
+    )
+    # Load the RAG service in a worker thread so health checks are served while it warms up
+    app.state.rag_service_task = asyncio.create_task(
+        asyncio.to_thread(get_rag_service, app.state.openai_rate_limiter)
+    )
+    app.state.rag_service_task.add_done_callback(_log_rag_service_failure)
+    yield
+    task = app.state.rag_service_task
+    if task.done() and not task.cancelled() and task.exception() is None:
+        await task.result().aclose()
+    else:
+        task.cancel()
+    app.state.openai_client.close()
+
+
 app = FastAPI(
     title=settings.api_title,
     version=settings.api_version,
     description=settings.api_description,
+    lifespan=lifespan,
 )
 
 # Set up CORS middleware for internal communication
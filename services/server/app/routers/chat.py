@@ -1,10 +1,16 @@
 from typing import List, Optional
 
 from app.core.config import settings
-from app.dependencies import get_rag_service_dependency
+from app.dependencies import (
+    get_openai_client,
+    get_openai_rate_limiter,
+    get_rag_service_dependency,
+)
 from app.services.rag_service import ChatMessage, RAGService
-from app.services.retriever import SearchResult
+from app.services.rate_limiter import AsyncTokenBucket, estimate_tokens
+from app.services.schemas import SearchResult
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from openai import OpenAI
 from pydantic import BaseModel
 
@@ -35,19 +41,55 @@ async def chat_completion(
             conversation_history=request.conversation_history
         )
 
+        if response.status == "cache_miss":
+            raise HTTPException(status_code=503, detail=response.response)
         if response.status == "error":
             raise HTTPException(status_code=500, detail=response.response)
         
-        return ChatResponse(
+        # Fields were already validated on RagServiceResponse, so skip constructor validation.
+        # FastAPI still dumps this model and validates the result against response_model.
+        return ChatResponse.model_construct(
             response=response.response,
             reasoning=response.reasoning,
             confidence=response.confidence,
             contexts=response.contexts
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
 
+@router.post(
+    "/chat/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+    tags=["chat"]
+)
+async def chat_completion_stream(
+    request: ChatRequest,
+    rag_service: RAGService = Depends(get_rag_service_dependency)
+):
+    """Stream the AI response as Server-Sent Events.
+
+    Emits `token` events with response text as it is generated, then a final
+    `metadata` event carrying the full ChatResponse fields, or an `error` event.
+    """
+    # Match /chat: a replay-mode miss is a 503, not a 200 stream carrying an error event
+    if settings.cache_mode == "replay" and not rag_service.has_cached_response(
+        request.message, request.conversation_history
+    ):
+        raise HTTPException(status_code=503, detail="No cached response available for this request.")
+
+    return StreamingResponse(
+        rag_service.stream_response(
+            message=request.message,
+            conversation_history=request.conversation_history
+        ),
+        media_type="text/event-stream"
+    )
+
+
 class TitleGenerationRequest(BaseModel):
     text: str
 
@@ -55,18 +97,21 @@ class TitleGenerationResponse(BaseModel):
     title: str
 
 @router.post("/generate-title", response_model=TitleGenerationResponse, tags=["chat"])
-async def generate_chat_title(request: TitleGenerationRequest):
+async def generate_chat_title(
+    request: TitleGenerationRequest,
+    client: OpenAI = Depends(get_openai_client),
+    rate_limiter: AsyncTokenBucket = Depends(get_openai_rate_limiter)
+):
     """Generate a concise title for chat content"""
     try:
-
-        client = OpenAI()
-        
         # Create a simple prompt for title generation
         prompt = f"""Generate a concise, descriptive title (max 100 characters) for the following text. The title should capture the main topic or question:
 
 Text: {request.text}
 
 Title:"""
+
+        await rate_limiter.acquire(estimate_tokens(prompt, max_tokens=100))
         
         response = client.chat.completions.create(
             model=settings.openai_model,
@@ -1,4 +1,7 @@
-from fastapi import APIRouter
+import json
+from typing import Literal
+
+from fastapi import APIRouter, Request, Response
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -10,21 +13,48 @@ class HealthResponse(BaseModel):
     version: str
 
 
-@router.get("/", response_model=HealthResponse, tags=["health"])
-async def root():
-    """Root endpoint for health check"""
-    return HealthResponse(
+# Serialized once; health probes return the same bytes on every call
+_HEALTH_JSON = json.dumps(
+    HealthResponse(
         status="healthy",
         service="AI Chatbot Service",
         version="1.0.0"
-    )
+    ).model_dump()
+).encode()
+
+
+@router.get("/", responses={200: {"model": HealthResponse}}, tags=["health"])
+async def root():
+    """Root endpoint for health check"""
+    return Response(content=_HEALTH_JSON, media_type="application/json")
 
 
-@router.get("/health", response_model=HealthResponse, tags=["health"])
+@router.get("/health", responses={200: {"model": HealthResponse}}, tags=["health"])
 async def health_check():
     """Health check endpoint"""
-    return HealthResponse(
-        status="healthy",
-        service="AI Chatbot Service",
-        version="1.0.0"
+    return Response(content=_HEALTH_JSON, media_type="application/json")
+
+
+class ReadinessResponse(BaseModel):
+    status: Literal["ready", "starting", "failed"]
+
+
+@router.get(
+    "/ready",
+    responses={200: {"model": ReadinessResponse}, 503: {"model": ReadinessResponse}},
+    tags=["health"]
+)
+async def readiness_check(request: Request):
+    """Readiness endpoint: 200 once the RAG service has loaded, 503 while loading or after a failure"""
+    task = request.app.state.rag_service_task
+    if not task.done():
+        status = "starting"
+    elif task.cancelled() or task.exception() is not None:
+        status = "failed"
+    else:
+        status = "ready"
+    return Response(
+        content=ReadinessResponse(status=status).model_dump_json(),
+        status_code=200 if status == "ready" else 503,
+        media_type="application/json"
     )
\ No newline at end of file
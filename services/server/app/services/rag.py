@@ -4,23 +4,39 @@ import dspy
 from app.services.retriever import PineconeRetriever, SearchResult
 from pydantic import BaseModel
 
+RULES = "You are a AI assistant for a fintech company. Use the provided history and context to answer the question. If the question is unrelated to the fintech company, politely decline to answer."
+
+# Parsed once at import; each RAG builds its own predictor from it so demos stay per-instance
+RESPOND_SIGNATURE = dspy.Signature("rules, history, context, question -> response")
+
 
 class RAGPrediction(BaseModel):
     response: str
     reasoning: str
     contexts: List[SearchResult]
 
+
+def format_context(passages: List[SearchResult]) -> str:
+    return "\n\n".join([passage.text for passage in passages])
+
+
 class RAG(dspy.Module):
     def __init__(self, retriever: PineconeRetriever):
         super().__init__()
         self._retriever = retriever
-        self.respond = dspy.ChainOfThought("rules, history, context, question -> response")
+        self.respond = dspy.ChainOfThought(RESPOND_SIGNATURE)
 
-    def forward(self, question: str, history: str = "") -> RAGPrediction:
+    def retrieve(self, question: str) -> List[SearchResult]:
         retrieval_result = self._retriever.forward(question)
-        context_passages: List[SearchResult] = retrieval_result.results if hasattr(retrieval_result, 'results') else [] # type: ignore We know this should return results
-        context = "\n\n".join([passage.text for passage in context_passages])
-        rules = "You are a AI assistant for a fintech company. Use the provided history and context to answer the question. If the question is unrelated to the fintech company, politely decline to answer."
-        response = self.respond(rules=rules, history=history, context=context, question=question)
+        return retrieval_result.results if hasattr(retrieval_result, 'results') else [] # type: ignore We know this should return results
+
+    async def aretrieve(self, question: str) -> List[SearchResult]:
+        retrieval_result = await self._retriever.aforward(question)
+        return retrieval_result.results if hasattr(retrieval_result, 'results') else [] # type: ignore We know this should return results
+
+    def forward(self, question: str, history: str = "") -> RAGPrediction:
+        context_passages = self.retrieve(question)
+        context = format_context(context_passages)
+        response = self.respond(rules=RULES, history=history, context=context, question=question)
 
         return RAGPrediction(response=response.response, reasoning=response.reasoning, contexts=context_passages)
\ No newline at end of file
@@ -1,14 +1,22 @@
+import hashlib
+import json
 import logging
-from functools import lru_cache
 from pathlib import Path
-from typing import List, Literal, Optional
+from typing import TYPE_CHECKING, AsyncIterator, List, Literal, Optional
 
-import dspy
 from app.core.config import settings
-from app.services.rag import RAG
-from app.services.retriever import PineconeRetriever, SearchResult
+from app.services.rate_limiter import AsyncTokenBucket, estimate_tokens
+from app.services.schemas import SearchResult
+from cachetools import TTLCache
 from pydantic import BaseModel
 
+# dspy, pinecone and the RAG module are imported lazily in RAGService so that
+# importing the API layer (and serving /health) does not pay their import cost
+if TYPE_CHECKING:
+    import dspy
+    from app.services.rag import RAG
+    from app.services.retriever import PineconeRetriever
+
 logger = logging.getLogger(__name__)
 
 class ChatMessage(BaseModel):
@@ -20,36 +28,121 @@ class RagServiceResponse(BaseModel):
     reasoning: str
     confidence: float
     contexts: List[SearchResult]
-    status: Literal["success", "error", "no_context"]
+    status: Literal["success", "error", "no_context", "cache_miss"]
+
+
+def format_history(conversation_history: Optional[List[ChatMessage]]) -> str:
+    """Render conversation history into the prompt block used by the RAG module"""
+    if not conversation_history:
+        return ""
+    # A list comprehension is faster than a generator here: str.join materializes its input anyway
+    history_text = "\n".join([f"{msg.role}: {msg.content}" for msg in conversation_history])
+    return f"Conversation History:\n{history_text}\n\n"
+
+
+def average_confidence(contexts: List[SearchResult]) -> float:
+    """Average retrieval score across the contexts used for a response"""
+    return sum(ctx.score for ctx in contexts) / len(contexts) if contexts else 0.0
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
 
 class RAGService:
-    def __init__(self):
-        dspy.configure(
-            lm=dspy.LM(
-                model=f"openai/{settings.openai_model}"
-            )
+    retriever: "PineconeRetriever"
+    rag: "RAG"
+    lm: "dspy.LM"
+
+    def __init__(self, rate_limiter: Optional[AsyncTokenBucket] = None):
+        import dspy
+        from app.services.rag import RAG, RULES, format_context
+        from app.services.retriever import PineconeRetriever
+
+        # Bind the lazily imported names once so request paths don't repeat the imports
+        self._dspy = dspy
+        self._rules = RULES
+        self._format_context = format_context
+
+        self.rate_limiter = rate_limiter or AsyncTokenBucket(
+            rpm=settings.openai_rpm_limit, tpm=settings.openai_tpm_limit
+        )
+
+        # Exact-match prompt cache so identical LM calls are served from memory
+        dspy.configure_cache(
+            enable_disk_cache=settings.llm_cache_enabled and settings.llm_cache_disk_enabled,
+            enable_memory_cache=settings.llm_cache_enabled,
+            memory_max_entries=settings.llm_cache_max_entries,
+        )
+        self.lm = dspy.LM(
+            model=f"openai/{settings.openai_model}",
+            cache=settings.llm_cache_enabled
         )
+        # Usage tracking reports the tokens each call actually used, which settles the rate-limit reservation
+        dspy.configure(lm=self.lm, track_usage=True)
 
         self.retriever = PineconeRetriever(
             k=settings.top_k_results,
             threshold=settings.similarity_threshold
         )
 
+        # Open the index connection now rather than on the first request
+        self.retriever.warm_up()
+
         # Check for optimized model in services directory
         optimized_model_path = Path("services/optimized_rag.json")
         if optimized_model_path.exists():
             try:
-                logger.info(f"Loading optimized RAG model from {optimized_model_path}")
+                logger.info("Loading optimized RAG model from %s", optimized_model_path)
                 self.rag = RAG(self.retriever)
                 self.rag.load(str(optimized_model_path))
                 logger.info("Successfully loaded optimized RAG model")
             except Exception as e:
-                logger.error(f"Failed to load optimized model: {e}. Using default RAG.")
+                logger.error("Failed to load optimized model: %s. Using default RAG.", e)
                 self.rag = RAG(self.retriever)
         else:
             logger.info("No optimized model found. Using default RAG initialization.")
             self.rag = RAG(self.retriever)
 
+        # Responses keyed on the full prompt inputs so repeated questions skip retrieval and the LM
+        self._response_cache: TTLCache[str, RagServiceResponse] = TTLCache(
+            maxsize=settings.cache_max_entries, ttl=settings.cache_ttl_seconds
+        )
+
+    def _cache_key(self, message: str, history: str) -> str:
+        key = f"{message}|{settings.openai_model}|{history}|{self.retriever.effective_top_k}|{self.retriever.threshold}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def has_cached_response(
+        self, message: str, conversation_history: Optional[List[ChatMessage]] = None
+    ) -> bool:
+        """Whether a response for this exact request is in the response cache"""
+        return self._cache_key(message, format_history(conversation_history)) in self._response_cache
+
+    async def _acquire_budget(self, history: str, context: str, message: str) -> int:
+        """Reserve rate-limit budget for the full prompt plus a typical completion; returns the tokens reserved"""
+        completion = settings.openai_completion_token_estimate
+        max_tokens = self.lm.kwargs.get("max_tokens")
+        if max_tokens:
+            completion = min(completion, max_tokens)
+        return await self.rate_limiter.acquire(
+            estimate_tokens(self._rules + history + context + message, max_tokens=completion)
+        )
+
+    def _settle_budget(self, reserved: int, prediction: "dspy.Prediction") -> None:
+        """Swap the reservation for the tokens actually used; LM cache hits report no usage and cost nothing"""
+        usage = prediction.get_lm_usage()
+        if not usage:
+            self.rate_limiter.release(reserved, requests=1)
+            return
+        used = sum(lm_usage.get("total_tokens") or 0 for lm_usage in usage.values())
+        self.rate_limiter.release(reserved - used)
+
+    async def aclose(self) -> None:
+        """Release network clients held by the service"""
+        from app.services.retriever import close_async_clients
+
+        await close_async_clients()
 
     async def generate_response(
         self, message: str, conversation_history: Optional[List[ChatMessage]] = None
@@ -57,36 +150,50 @@ class RAGService:
         """Generate response using DSPy RAG module"""
         try:
             # Prepare the question with conversation history if available
-            history_str = ""
-            if conversation_history:
-                history_text = "\n".join(
-                    [
-                        f"{msg.role}: {msg.content}"
-                        for msg in conversation_history
-                    ]
-                )
-                history_str = f"Conversation History:\n{history_text}\n\n"
-
-            # Use DSPy RAG module to generate response
-            result = self.rag.forward(message, history_str)
-
-            # Calculate average confidence from context scores
-            avg_confidence = (
-                sum(ctx.score for ctx in result.contexts) / len(result.contexts)
-                if result.contexts
-                else 0.0
+            history_str = format_history(conversation_history)
+
+            cache_key = self._cache_key(message, history_str)
+            if settings.cache_mode in ("enabled", "replay"):
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+                if settings.cache_mode == "replay":
+                    return RagServiceResponse(
+                        response="No cached response available for this request.",
+                        reasoning="",
+                        confidence=0.0,
+                        contexts=[],
+                        status="cache_miss"
+                    )
+
+            # Retrieve first so the rate-limit estimate covers the context sent to the LM
+            contexts = await self.rag.aretrieve(message)
+            context = self._format_context(contexts)
+
+            reserved = await self._acquire_budget(history_str, context, message)
+
+            # Use DSPy RAG module to generate response without blocking the event loop
+            prediction = await self.rag.respond.acall(
+                rules=self._rules, history=history_str, context=context, question=message
             )
+            self._settle_budget(reserved, prediction)
 
-            return RagServiceResponse(
-                response=result.response,
-                reasoning=result.reasoning,
-                confidence=avg_confidence,
-                contexts=result.contexts,
+            response = RagServiceResponse(
+                response=prediction.response,
+                reasoning=prediction.reasoning,
+                confidence=average_confidence(contexts),
+                contexts=contexts,
                 status="success"
             )
 
+            # An answer without contexts may come from a failed retrieval; don't pin it in the cache
+            if contexts and settings.cache_mode in ("enabled", "write_only"):
+                self._response_cache[cache_key] = response
+
+            return response
+
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
+            logger.error("Error generating response: %s", e)
             return RagServiceResponse(
                 response="I apologize, but I'm having trouble processing your request right now. ",
                 reasoning="",
@@ -94,10 +201,70 @@ class RAGService:
                 contexts=[],
                 status="error"
             )
-            
+
+    async def stream_response(
+        self, message: str, conversation_history: Optional[List[ChatMessage]] = None
+    ) -> AsyncIterator[str]:
+        """Stream response tokens as Server-Sent Events, followed by a metadata event"""
+        dspy = self._dspy
+
+        try:
+            history_str = format_history(conversation_history)
+
+            cache_key = self._cache_key(message, history_str)
+            if settings.cache_mode in ("enabled", "replay"):
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    yield sse_event("metadata", cached.model_dump_json())
+                    return
+                if settings.cache_mode == "replay":
+                    yield sse_event("error", json.dumps({"detail": "No cached response available for this request."}))
+                    return
+
+            contexts = await self.rag.aretrieve(message)
+            context = self._format_context(contexts)
+
+            reserved = await self._acquire_budget(history_str, context, message)
+
+            # Stream listeners keep per-stream state and stop emitting once their stream ends,
+            # so every request needs its own listener and streamified predictor
+            stream_respond = dspy.streamify(
+                self.rag.respond,
+                stream_listeners=[dspy.streaming.StreamListener(signature_field_name="response")]
+            )
+
+            prediction = None
+            async for chunk in stream_respond(
+                rules=self._rules, history=history_str, context=context, question=message
+            ):
+                if isinstance(chunk, dspy.streaming.StreamResponse):
+                    yield sse_event("token", json.dumps({"content": chunk.chunk}))
+                elif isinstance(chunk, dspy.Prediction):
+                    prediction = chunk
+
+            if prediction is None:
+                raise RuntimeError("Stream ended without a prediction")
+            self._settle_budget(reserved, prediction)
+
+            response = RagServiceResponse(
+                response=prediction.response,
+                reasoning=prediction.reasoning,
+                confidence=average_confidence(contexts),
+                contexts=contexts,
+                status="success"
+            )
+
+            if contexts and settings.cache_mode in ("enabled", "write_only"):
+                self._response_cache[cache_key] = response
+
+            yield sse_event("metadata", response.model_dump_json())
+
+        except Exception as e:
+            logger.error("Error streaming response: %s", e)
+            yield sse_event("error", json.dumps({"detail": "I apologize, but I'm having trouble processing your request right now. "}))
+
 
 
-@lru_cache()
-def get_rag_service() -> RAGService:
-    """Get singleton instance of RAG service"""
-    return RAGService()
+def get_rag_service(rate_limiter: Optional[AsyncTokenBucket] = None) -> RAGService:
+    """Create the RAG service instance"""
+    return RAGService(rate_limiter=rate_limiter)
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+
+def estimate_tokens(text: str, max_tokens: int = 0) -> int:
+    """Rough prompt size (~4 characters per token) plus the completion budget"""
+    return len(text) // 4 + max_tokens
+
+
+class AsyncTokenBucket:
+    """
+    Client-side limiter for OpenAI requests-per-minute and tokens-per-minute budgets.
+
+    Both buckets start full and refill continuously at rate/60 per second up to their
+    capacity, so callers wait for budget instead of triggering 429s and retries.
+    A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm > 0:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm > 0:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, estimated_tokens: int = 0) -> int:
+        """Wait until one request and `estimated_tokens` tokens are available, take them and return the tokens taken"""
+        if not self.enabled:
+            return 0
+
+        # A single call can never need more than a full bucket
+        tokens = min(estimated_tokens, self.tpm) if self.tpm > 0 else 0
+
+        while True:
+            # Only check-and-take runs under the lock; sleeping with it held would queue every
+            # caller behind the slowest one, even callers whose budget is already available
+            async with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.rpm > 0 and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if self.tpm > 0 and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if wait <= 0:
+                    if self.rpm > 0:
+                        self._requests -= 1
+                    self._tokens -= tokens
+                    return tokens
+            await asyncio.sleep(wait)
+
+    def release(self, tokens: int = 0, requests: int = 0) -> None:
+        """
+        Return budget taken by acquire once the real cost is known.
+
+        A negative `tokens` charges for usage beyond the reservation; the bucket may then go
+        below zero, making later callers wait until the overrun has been refilled.
+        """
+        if not self.enabled:
+            return
+        self._refill()
+        if self.rpm > 0:
+            self._requests = min(self.rpm, self._requests + requests)
+        if self.tpm > 0:
+            self._tokens = min(self.tpm, self._tokens + tokens)
\ No newline at end of file
@@ -1,30 +1,187 @@
  
+import asyncio
+import hashlib
 import logging
-from typing import List, Optional
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
+import diskcache
 import dspy
 from app.core.config import settings
-from pinecone import Pinecone, SearchQuery, SearchRerank
-from pydantic import BaseModel
+from app.services.schemas import SearchResult
+from pinecone import Pinecone, PineconeAsyncio, SearchQuery, SearchRerank
+from pinecone.core.openapi.db_data.models import SearchRecordsResponse
+from pinecone.db_data import Index, IndexAsyncio
 
 logger = logging.getLogger(__name__)
 
-class SearchResult(BaseModel):
-    id: str
-    score: float
-    text: str
-    category: str
+# Clients are shared process-wide so every retriever (and every copy DSPy makes of one)
+# reuses the same connection pools instead of repeating TLS setup and host lookups.
+_clients_lock = threading.Lock()
+_async_indexes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, IndexAsyncio]]" = weakref.WeakKeyDictionary()
+
+# The rerank config is the same for every query; build it once and reuse it.
+_RERANK = SearchRerank(model="pinecone-rerank-v0", rank_fields=["text"])
+# Only the fields SearchResult reads; the default returns every stored field
+_FIELDS = ["text", "category"]
+
+
+@lru_cache(maxsize=4)
+def _get_pc(api_key: str) -> Pinecone:
+    return Pinecone(api_key=api_key)
+
+
+@lru_cache(maxsize=4)
+def _resolve_host(api_key: str, index_name: str) -> str:
+    return _get_pc(api_key).describe_index(index_name).host
+
+
+@lru_cache(maxsize=4)
+def _get_index(api_key: str, host: str) -> Index:
+    return _get_pc(api_key).Index(host=host)
+
+
+def _get_async_index(api_key: str, host: str) -> IndexAsyncio:
+    """Async index handles hold an aiohttp session bound to one event loop, so cache per loop."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        indexes = _async_indexes.setdefault(loop, {})
+        index = indexes.get(host)
+        if index is None:
+            index = indexes[host] = PineconeAsyncio(api_key=api_key).IndexAsyncio(host=host)
+        return index
+
+
+async def close_async_clients() -> None:
+    """Close the async index handles opened on the running event loop."""
+    with _clients_lock:
+        indexes = _async_indexes.pop(asyncio.get_running_loop(), {})
+    for index in indexes.values():
+        await index.close()
+
+
+class _RetrievalCache:
+    """
+    Process-wide LRU of retrieval results keyed on normalized query text.
+    Evaluation and optimization passes re-run the same questions, so repeats skip Pinecone.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: "OrderedDict[Tuple, dspy.Prediction]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[dspy.Prediction]:
+        with self._lock:
+            prediction = self._entries.get(key)
+            if prediction is not None:
+                self._entries.move_to_end(key)
+            return prediction
+
+    def put(self, key: Tuple, prediction: dspy.Prediction) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = prediction
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def resize(self, capacity: int) -> None:
+        with self._lock:
+            self.capacity = capacity
+            while len(self._entries) > max(capacity, 0):
+                self._entries.popitem(last=False)
+
+
+class _DiskRetrievalCache:
+    """
+    Optional second tier behind the LRU that persists results across processes, so
+    re-running the optimizer on the same data doesn't repeat its Pinecone calls.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: int):
+        self.directory = directory
+        self.expire = ttl_seconds or None
+        self._cache: Optional[diskcache.Cache] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> diskcache.Cache:
+        # Opened on first use so merely importing the module never touches the disk
+        with self._lock:
+            if self._cache is None:
+                self._cache = diskcache.Cache(self.directory)
+            return self._cache
+
+    @staticmethod
+    def _digest(key: Tuple) -> str:
+        raw = repr((*key, _RERANK.model)).encode()
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    def get(self, key: Tuple) -> Optional[dspy.Prediction]:
+        try:
+            entry = self._open().get(self._digest(key))
+        except Exception as e:
+            logger.warning("Retrieval disk cache read failed: %s", e)
+            return None
+        if entry is None:
+            return None
+        passages, results = entry
+        return dspy.Prediction(passages=passages, results=results)
+
+    def put(self, key: Tuple, prediction: dspy.Prediction) -> None:
+        # Store plain tuples rather than the Prediction so entries don't depend on dspy internals
+        entry = (tuple(prediction.passages), tuple(prediction.results))
+        try:
+            self._open().set(self._digest(key), entry, expire=self.expire)
+        except Exception as e:
+            logger.warning("Retrieval disk cache write failed: %s", e)
+
+
+_retrieval_cache = _RetrievalCache(settings.retriever_cache_size)
+# Only the optimizer turns this on; the API server should always see the live index
+_disk_cache: Optional[_DiskRetrievalCache] = None
+
+
+def enable_retrieval_cache(capacity: int) -> None:
+    """Turn on (or resize) the process-wide retrieval LRU, e.g. for repeated evaluation passes."""
+    _retrieval_cache.resize(capacity)
+
+
+def enable_disk_retrieval_cache(directory: str, ttl_seconds: int) -> None:
+    """Persist retrievals on disk behind the LRU so repeated optimizer runs skip Pinecone."""
+    global _disk_cache
+    _disk_cache = _DiskRetrievalCache(directory, ttl_seconds)
+
 
 class PineconeRetriever(dspy.Retrieve):
     """
     Queries a Pinecone index and returns passages for DSPy.
-    Uses SentenceTransformers for embedding generation.
+    Uses Pinecone's integrated search: the query text is embedded and the hits
+    reranked server-side, so no embedding model runs in this process.
     """
 
-    def __init__(self, k: int = 5, threshold: float = 0.7, namespace: str = "__default__"):
+    def __init__(
+        self,
+        k: int = 5,
+        threshold: float = 0.7,
+        namespace: str = "__default__",
+        adaptive_top_k: bool = False,
+    ):
         super().__init__(k=k)
         self.threshold = threshold
         self.namespace = namespace
+        self.adaptive_top_k = adaptive_top_k
+        # Running average of hits kept after thresholding, used to size top_k adaptively
+        self._kept_ewma = float(self.k)
 
         # Save only lightweight config you need to rebuild the client later.
         self._config = {
@@ -34,38 +191,162 @@ class PineconeRetriever(dspy.Retrieve):
             "threshold": self.threshold,
         }
 
-        self._pc = Pinecone(api_key=settings.pinecone_api_key)
-        self._index = self._pc.Index(self._config["index_name"])
+        self._reset_session()
+        self._init_clients()
 
     def forward(self, query: str, k: Optional[int] = None, **kwargs) -> dspy.Prediction:
+        top_k = self._top_k(k)
+        key = self._cache_key(query, top_k)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
         try:
             rr = self._index.search(
                 namespace=self.namespace,
-                query=SearchQuery(inputs={'text': query}, top_k=k or self.k),
-                rerank=SearchRerank(model="pinecone-rerank-v0", rank_fields=["text"])
-            ).to_dict()
-
-            hits = rr.get("result", {}).get("hits", [])
-            matches: List[SearchResult] = []
-            passages: List[str] = []
-
-            for h in hits:
-                fields = h.get("fields", {}) or {}
-                sr = SearchResult(
-                    id=h.get("_id"),
-                    score=h.get("_score", 0.0),
-                    text=fields.get("text", ""),
-                    category=fields.get("category", "")
-                )
-                if sr.score >= self.threshold:
-                    matches.append(sr)
-                    passages.append(sr.text)
-
-            return dspy.Prediction(passages=passages, results=matches)
+                query=SearchQuery(inputs={'text': query}, top_k=top_k),
+                rerank=_RERANK,
+                fields=_FIELDS
+            )
+
+            prediction = self._to_prediction(rr)
+            self._record_kept(k, len(prediction.results))
+            self._store(key, prediction)
+            return prediction
+
+        except Exception as e:
+            logger.error("PineconeRetriever error: %s", e)
+            return dspy.Prediction(passages=(), results=())
+
+    async def aforward(self, query: str, k: Optional[int] = None, **kwargs) -> dspy.Prediction:
+        """Async variant of forward that searches without blocking the event loop."""
+        top_k = self._top_k(k)
+        key = self._cache_key(query, top_k)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        try:
+            index = _get_async_index(settings.pinecone_api_key, self._host)
+            response = await index.search(
+                namespace=self.namespace,
+                query=SearchQuery(inputs={'text': query}, top_k=top_k),
+                rerank=_RERANK,
+                fields=_FIELDS
+            )
+
+            prediction = self._to_prediction(response)
+            self._record_kept(k, len(prediction.results))
+            self._store(key, prediction)
+            return prediction
+
+        except Exception as e:
+            logger.error("PineconeRetriever error: %s", e)
+            return dspy.Prediction(passages=(), results=())
+
+    async def abatch_retrieve(
+        self, queries: List[str], k: Optional[int] = None, max_concurrency: int = 32
+    ) -> List[dspy.Prediction]:
+        """Retrieve many queries concurrently on one event loop; results land in the retrieval cache."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def retrieve(query: str) -> dspy.Prediction:
+            async with semaphore:
+                return await self.aforward(query, k=k)
 
+        return list(await asyncio.gather(*(retrieve(query) for query in queries)))
+
+    def prefetch(self, queries: List[str], k: Optional[int] = None) -> List[dspy.Prediction]:
+        """Blocking wrapper around abatch_retrieve for synchronous callers such as the optimizer."""
+        async def run() -> List[dspy.Prediction]:
+            try:
+                return await self.abatch_retrieve(queries, k=k)
+            finally:
+                await close_async_clients()
+
+        return asyncio.run(run())
+
+    def pin(self, queries: List[str], k: Optional[int] = None) -> None:
+        """
+        Retrieve queries once and hold the results on this retriever until unpin(),
+        so repeated passes over the same questions never fall out of the shared LRU.
+        """
+        self._pinning = True
+        try:
+            self.prefetch(queries, k=k)
+        finally:
+            self._pinning = False
+
+    def unpin(self) -> None:
+        self._session_cache.clear()
+
+    def _cached(self, key: Tuple) -> Optional[dspy.Prediction]:
+        prediction = self._session_cache.get(key)
+        if prediction is None:
+            prediction = _retrieval_cache.get(key)
+            if prediction is None and _disk_cache is not None:
+                prediction = _disk_cache.get(key)
+                if prediction is not None:
+                    _retrieval_cache.put(key, prediction)
+            if prediction is not None and self._pinning:
+                self._session_cache[key] = prediction
+        return prediction
+
+    def _store(self, key: Tuple, prediction: dspy.Prediction) -> None:
+        _retrieval_cache.put(key, prediction)
+        if _disk_cache is not None:
+            _disk_cache.put(key, prediction)
+        if self._pinning:
+            self._session_cache[key] = prediction
+
+    @property
+    def effective_top_k(self) -> int:
+        """Number of hits the next search will request when no explicit k is given."""
+        return self._top_k(None)
+
+    def _top_k(self, k: Optional[int]) -> int:
+        """Number of hits to request; an explicit k always wins over the adaptive estimate."""
+        if k or not self.adaptive_top_k:
+            return k or self.k
+        # Ask for some headroom over the recent yield, but never more than the configured k
+        return max(1, min(self.k, math.ceil(self._kept_ewma * 1.5)))
+
+    def _record_kept(self, k: Optional[int], kept: int) -> None:
+        if self.adaptive_top_k and not k:
+            self._kept_ewma = 0.8 * self._kept_ewma + 0.2 * kept
+
+    def _cache_key(self, query: str, top_k: int) -> Tuple:
+        # Deliberately approximate: queries differing only in surrounding or repeated whitespace
+        # share an entry. Case is kept, since the embedding and rerank models are case-sensitive.
+        normalized = " ".join(query.split())
+        return (self._config["index_name"], self.namespace, top_k, self.threshold, normalized)
+
+    def _to_prediction(self, rr: SearchRecordsResponse) -> dspy.Prediction:
+        # Read the response models in place; to_dict() would convert every hit first
+        hits = rr["result"]["hits"]
+        matches: List[SearchResult] = []
+        passages: List[str] = []
+
+        # Reranked hits come back ordered by score, so the first one under the threshold ends the scan
+        thr = self.threshold
+        for h in hits:
+            score = float(h.get("_score", 0.0))
+            if score < thr:
+                break
+            fields = h.get("fields") or {}
+            text = fields.get("text", "") or ""
+            matches.append(SearchResult(h["_id"], score, text, fields.get("category", "") or ""))
+            passages.append(text)
+
+        # Predictions are shared through the retrieval caches, so hand them out immutable
+        return dspy.Prediction(passages=tuple(passages), results=tuple(matches))
+
+    def warm_up(self) -> None:
+        """Make a cheap call against the index so its connection pool is established."""
+        try:
+            self._index.describe_index_stats()
         except Exception as e:
-            logger.error(f"PineconeRetriever error: {e}")
-            return dspy.Prediction(passages=[], results=[])
+            logger.warning("PineconeRetriever warm-up failed: %s", e)
 
     # ----- Copy / serialization hooks -----
     def dump_state(self, json_mode: bool = False):
@@ -80,6 +361,7 @@ class PineconeRetriever(dspy.Retrieve):
             self.k = int(self._config.get("k", self.k))
             self.threshold = float(self._config.get("threshold", self.threshold))
             self.namespace = self._config.get("namespace", self.namespace)
+            self._kept_ewma = float(self.k)
             # Recreate clients:
             self._init_clients()
         return None
@@ -89,16 +371,28 @@ class PineconeRetriever(dspy.Retrieve):
         return self
 
     def __getstate__(self):
-        return {"config": self._config}
+        return {"config": self._config, "adaptive_top_k": self.adaptive_top_k}
 
     def __setstate__(self, state):
         self._config = state.get("config", {})
         self.k = int(self._config.get("k", 5))
         self.threshold = float(self._config.get("threshold", 0.7))
         self.namespace = self._config.get("namespace", "__default__")
+        self.adaptive_top_k = bool(state.get("adaptive_top_k", False))
+        self._kept_ewma = float(self.k)
+        self._reset_session()
         self._init_clients()
 
     # ----- Internals -----
+    def _reset_session(self):
+        self._session_cache: Dict[Tuple, dspy.Prediction] = {}
+        self._pinning = False
+
     def _init_clients(self):
-        self._pc = Pinecone(api_key=settings.pinecone_api_key)
-        self._index = self._pc.Index(self._config["index_name"])
\ No newline at end of file
+        # Resolve the data-plane host once: the async client requires it, and targeting
+        # by host skips the describe_index lookup Index(name) would otherwise make
+        with _clients_lock:
+            self._host = settings.pinecone_index_host or _resolve_host(
+                settings.pinecone_api_key, self._config["index_name"]
+            )
+            self._index = _get_index(settings.pinecone_api_key, self._host)
\ No newline at end of file
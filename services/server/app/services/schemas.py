@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+
+
+# A plain slotted dataclass rather than a pydantic model: retrieval builds one per hit,
+# and the values are coerced where they are read from the Pinecone response.
+@dataclass(slots=True, frozen=True)
+class SearchResult:
+    id: str
+    score: float
+    text: str
+    category: str
\ No newline at end of file
@@ -1,7 +1,11 @@
 """DSPy optimizer configuration and training."""
 import argparse
 import logging
+import multiprocessing
+import statistics
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Literal, Optional, Tuple
 
@@ -9,8 +13,9 @@ import dspy
 
 sys.path.append(str(Path(__file__).parent.parent))
 
+from app.core.config import settings
 from app.services.rag import RAG
-from app.services.retriever import PineconeRetriever
+from app.services.retriever import PineconeRetriever, enable_disk_retrieval_cache, enable_retrieval_cache
 from dspy.evaluate import SemanticF1
 
 logger = logging.getLogger(__name__)
@@ -42,9 +47,21 @@ class RAGOptimizer:
         self.optimizer_type = optimizer_type
         self.metric_type = metric_type
         
+        # Evaluation and bootstrap passes repeat the same questions, so cache their retrievals
+        enable_retrieval_cache(settings.retriever_cache_size or 1024)
+        if settings.pinecone_retriever_cache:
+            enable_disk_retrieval_cache(
+                settings.pinecone_retriever_cache_dir, settings.pinecone_retriever_cache_ttl_seconds
+            )
+        
         # Set up DSPy LM
         self.lm = dspy.LM(model_name)
         dspy.configure(lm=self.lm)
+
+        # Running cost total, advanced incrementally over new history entries
+        self._cost_sum = 0.0
+        self._cost_last: Optional[Dict[str, Any]] = None
+        self._cost_lock = threading.Lock()
         
         # Set up metric
         if metric_type == "semantic_f1":
@@ -52,7 +69,7 @@ class RAGOptimizer:
         else:
             raise ValueError(f"Unknown metric type: {metric_type}")
             
-        logger.info(f"Initialized RAG optimizer with {model_name} and {metric_type} metric")
+        logger.info("Initialized RAG optimizer with %s and %s metric", model_name, metric_type)
         
     def prepare_examples(
         self,
@@ -83,7 +100,7 @@ class RAGOptimizer:
             ).with_inputs('question')
             examples.append(example)
             
-        logger.info(f"Prepared {len(examples)} examples")
+        logger.info("Prepared %s examples", len(examples))
         return examples
     
     def create_module(self) -> dspy.Module:
@@ -94,7 +111,7 @@ class RAGOptimizer:
             DSPy module instance
         """
 
-        return RAG(PineconeRetriever())
+        return RAG(self.retriever)
     
     def optimize(
         self,
@@ -118,7 +135,7 @@ class RAGOptimizer:
         Returns:
             Optimized module
         """
-        logger.info(f"Starting optimization with {self.optimizer_type}")
+        logger.info("Starting optimization with %s", self.optimizer_type)
         
         if self.optimizer_type == "bootstrap":
             optimizer = dspy.BootstrapFewShot(
@@ -143,7 +160,8 @@ class RAGOptimizer:
         module: dspy.Module,
         dataset: List[dspy.Example],
         num_threads: int = 4,
-        display_progress: bool = True
+        display_progress: bool = True,
+        prefetch: bool = True
     ) -> Dict[str, Any]:
         """
         Evaluate a module on a dataset.
@@ -153,11 +171,17 @@ class RAGOptimizer:
             dataset: List of examples to evaluate on
             num_threads: Number of threads for evaluation
             display_progress: Whether to show progress bar
+            prefetch: Whether to fetch all retrievals up front (skip if the caller already pinned them)
             
         Returns:
             Evaluation results
         """
-        logger.info(f"Evaluating module on {len(dataset)} examples")
+        logger.info("Evaluating module on %s examples", len(dataset))
+
+        # Fan out every retrieval at once so the evaluator's threads hit the retrieval cache
+        retriever = getattr(module, '_retriever', self.retriever)
+        if prefetch and isinstance(retriever, PineconeRetriever):
+            retriever.prefetch([example.question for example in dataset])
         
         evaluator = dspy.Evaluate(
             devset=dataset,
@@ -185,7 +209,7 @@ class RAGOptimizer:
             'model_name': self.model_name
         }
         
-        logger.info(f"Evaluation completed. Average score: {average_score:.3f}")
+        logger.info("Evaluation completed. Average score: %.3f", average_score)
         return results
     
     def save_module(self, module: dspy.Module, filepath: str) -> None:
@@ -198,7 +222,7 @@ class RAGOptimizer:
         """
         Path(filepath).parent.mkdir(parents=True, exist_ok=True)
         module.save(filepath)
-        logger.info(f"Saved module to {filepath}")
+        logger.info("Saved module to %s", filepath)
     
     def load_module(self, filepath: str) -> dspy.Module:
         """
@@ -213,7 +237,7 @@ class RAGOptimizer:
         """
         module = self.create_module()
         module.load(filepath)
-        logger.info(f"Loaded module from {filepath}")
+        logger.info("Loaded module from %s", filepath)
         return module
     
     def get_cost(self) -> float:
@@ -224,10 +248,26 @@ class RAGOptimizer:
             Total cost in USD
         """
         try:
-            cost = sum([x['cost'] for x in self.lm.history if x['cost'] is not None])
-            return cost
+            with self._cost_lock:
+                history = self.lm.history
+                # The history is capped and drops its oldest entries, so find where we left
+                # off by identity rather than by position
+                start = 0
+                if self._cost_last is not None:
+                    for i in range(len(history) - 1, -1, -1):
+                        if history[i] is self._cost_last:
+                            start = i + 1
+                            break
+                # Snapshot once: entries appended by evaluator threads after this are left for the next call
+                new_entries = history[start:]
+                for entry in new_entries:
+                    if entry.get('cost') is not None:
+                        self._cost_sum += entry['cost']
+                if new_entries:
+                    self._cost_last = new_entries[-1]
+                return self._cost_sum
         except Exception as e:
-            logger.error(f"Error calculating cost: {e}")
+            logger.error("Error calculating cost: %s", e)
             return 0.0
 
 
@@ -270,13 +310,24 @@ def run_optimization_pipeline(
         test_questions, test_responses = zip(*test_data)
         testset = optimizer.prepare_examples(list(test_questions), list(test_responses))
     
-    # Create and evaluate baseline
-    baseline_module = optimizer.create_module()
-    baseline_score = optimizer.evaluate(baseline_module, valset or trainset)
-    
-    # Optimize the module
-    optimized_module = optimizer.optimize(baseline_module, trainset)
-    optimized_score = optimizer.evaluate(optimized_module, valset or trainset)
+    # Baseline and optimized modules share the retriever, so retrieve the eval set once
+    # and keep it pinned across both evaluations and the bootstrap in between
+    eval_set = valset or trainset
+    pinned = isinstance(retriever, PineconeRetriever)
+    if pinned:
+        retriever.pin([example.question for example in eval_set])
+
+    try:
+        # Create and evaluate baseline
+        baseline_module = optimizer.create_module()
+        baseline_score = optimizer.evaluate(baseline_module, eval_set, prefetch=not pinned)
+        
+        # Optimize the module
+        optimized_module = optimizer.optimize(baseline_module, trainset)
+        optimized_score = optimizer.evaluate(optimized_module, eval_set, prefetch=not pinned)
+    finally:
+        if pinned:
+            retriever.unpin()
     
     # Test evaluation if provided
     test_score = None
@@ -301,7 +352,103 @@ def run_optimization_pipeline(
         'test_examples': len(testset) if testset else 0,
     }
     
-    logger.info(f"Optimization pipeline completed. Improvement: {results['improvement']:.3f}")
+    logger.info("Optimization pipeline completed. Improvement: %.3f", results['improvement'])
+    return results
+
+
+def _run_fold(
+    training_data: List[Tuple[str, str]],
+    validation_data: List[Tuple[str, str]],
+    model_name: str
+) -> Dict[str, Any]:
+    """Run one cross-validation fold in its own process with its own retriever and LM."""
+    logging.basicConfig(level=logging.INFO)
+    return run_optimization_pipeline(
+        retriever=PineconeRetriever(adaptive_top_k=settings.retriever_adaptive_top_k),
+        training_data=training_data,
+        validation_data=validation_data,
+        model_name=model_name
+    )
+
+
+def _kfold_splits(
+    data: List[Tuple[str, str]], k_folds: int
+) -> List[Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]]:
+    """Split data into k interleaved folds; returns (training, validation) pairs, one per fold."""
+    folds = [data[i::k_folds] for i in range(k_folds)]
+    return [
+        ([pair for j, fold in enumerate(folds) if j != i for pair in fold], folds[i])
+        for i in range(k_folds)
+    ]
+
+
+def _stdev(values: List[float]) -> float:
+    # statistics.stdev raises on fewer than two values
+    return statistics.stdev(values) if len(values) > 1 else 0.0
+
+
+def _aggregate_fold_results(fold_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mean and sample standard deviation of the per-fold scores, plus total cost."""
+    baseline_scores = [r['baseline_score']['average_score'] for r in fold_results]
+    optimized_scores = [r['optimized_score']['average_score'] for r in fold_results]
+    improvements = [r['improvement'] for r in fold_results]
+    
+    return {
+        'folds': fold_results,
+        'baseline_mean': statistics.mean(baseline_scores),
+        'baseline_std': _stdev(baseline_scores),
+        'optimized_mean': statistics.mean(optimized_scores),
+        'optimized_std': _stdev(optimized_scores),
+        'improvement_mean': statistics.mean(improvements),
+        'total_cost_usd': sum(r['total_cost_usd'] for r in fold_results),
+    }
+
+
+def run_kfold_cross_validation(
+    data: List[Tuple[str, str]],
+    k_folds: int = 5,
+    model_name: str = "openai/gpt-4o-mini",
+    max_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Run the optimization pipeline over k folds concurrently.
+    
+    Each fold runs in a separate process: dspy settings can only be changed by the
+    thread that first configured them, and separate processes also keep per-fold
+    LM history (and therefore cost) apart.
+    
+    Args:
+        data: List of (question, response) tuples to split into folds
+        k_folds: Number of folds
+        model_name: DSPy language model to use
+        max_workers: Maximum number of folds to run at once (defaults to k_folds)
+        
+    Returns:
+        Dictionary with per-fold results and aggregate scores
+    """
+    if k_folds < 2:
+        raise ValueError(f"k_folds must be at least 2, got {k_folds}")
+    if len(data) < k_folds:
+        raise ValueError(f"Need at least {k_folds} examples for {k_folds}-fold CV, got {len(data)}")
+    
+    splits = _kfold_splits(data, k_folds)
+    
+    logger.info("Running %s-fold cross-validation on %s examples", k_folds, len(data))
+    
+    # Spawn rather than fork so workers don't inherit client threads or connection pools
+    with ProcessPoolExecutor(
+        max_workers=max_workers or k_folds,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(_run_fold, training_data, validation_data, model_name)
+            for training_data, validation_data in splits
+        ]
+        fold_results = [future.result() for future in futures]
+    
+    results = _aggregate_fold_results(fold_results)
+    
+    logger.info("Cross-validation completed. Mean improvement: %.3f", results['improvement_mean'])
     return results
 
 
@@ -320,12 +467,20 @@ def load_csv_data(train_csv: str, val_csv: str) -> Tuple[List[Tuple[str, str]],
     
     def load_csv(filepath: str) -> List[Tuple[str, str]]:
         data = []
-        with open(filepath, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            # Resolve the column positions once from the header (either capitalization)
+            header = [name.strip().lower() for name in next(reader, [])]
+            if 'question' not in header or 'answer' not in header:
+                return data
+            q_idx = header.index('question')
+            a_idx = header.index('answer')
+            min_len = max(q_idx, a_idx) + 1
             for row in reader:
-                # Handle both capitalized and lowercase column names
-                question = (row.get('Question') or row.get('question', '')).strip()
-                answer = (row.get('Answer') or row.get('answer', '')).strip()
+                if len(row) < min_len:
+                    continue
+                question = row[q_idx].strip()
+                answer = row[a_idx].strip()
                 if question and answer:
                     data.append((question, answer))
         return data
@@ -333,8 +488,8 @@ def load_csv_data(train_csv: str, val_csv: str) -> Tuple[List[Tuple[str, str]],
     train_data = load_csv(train_csv)
     val_data = load_csv(val_csv)
     
-    logger.info(f"Loaded {len(train_data)} training examples from {train_csv}")
-    logger.info(f"Loaded {len(val_data)} validation examples from {val_csv}")
+    logger.info("Loaded %s training examples from %s", len(train_data), train_csv)
+    logger.info("Loaded %s validation examples from %s", len(val_data), val_csv)
     
     return train_data, val_data
 
@@ -355,7 +510,7 @@ def test_optimized_model(
     Returns:
         Dictionary with test results
     """
-    logger.info(f"Loading optimized model from {model_path}")
+    logger.info("Loading optimized model from %s", model_path)
     
     # Initialize optimizer to load the model
     optimizer = RAGOptimizer(
@@ -367,27 +522,30 @@ def test_optimized_model(
     optimized_model = optimizer.load_module(model_path)
     
     # Run the query
-    logger.info(f"Testing query: '{test_query}'")
+    logger.info("Testing query: '%s'", test_query)
     result = optimized_model(test_query)
     
+    # Trim each context for display, checking its length once
+    contexts = []
+    for ctx in result.contexts:
+        text = ctx.text
+        contexts.append({
+            'text': text[:200] + '...' if len(text) > 200 else text,
+            'score': ctx.score,
+            'category': ctx.category
+        })
+
     # Extract response details
     response_data = {
         'query': test_query,
         'response': result.response,
-        'reasoning': getattr(result, 'reasoning', 'Not available'),
-        'num_contexts': len(result.contexts),
-        'contexts': [
-            {
-                'text': ctx.text[:200] + '...' if len(ctx.text) > 200 else ctx.text,
-                'score': ctx.score,
-                'category': ctx.category
-            }
-            for ctx in result.contexts
-        ],
+        'reasoning': result.reasoning,
+        'num_contexts': len(contexts),
+        'contexts': contexts,
         'cost_usd': optimizer.get_cost()
     }
     
-    logger.info(f"Response generated. Cost: ${response_data['cost_usd']:.4f}")
+    logger.info("Response generated. Cost: $%.4f", response_data['cost_usd'])
     return response_data
 
 
@@ -429,6 +587,25 @@ if __name__ == "__main__":
                 for i, ctx in enumerate(test_results['contexts'], 1):
                     print(f"  {i}. [Score: {ctx['score']:.3f}] {ctx['text']}")
             
+        elif args.train_csv and args.val_csv and args.use_kfold:
+            # Cross-validation mode
+            train_data, val_data = load_csv_data(args.train_csv, args.val_csv)
+            
+            # Cross-validate over the combined data; folds run in parallel
+            cv_results = run_kfold_cross_validation(
+                data=train_data + val_data,
+                k_folds=args.k_folds,
+                model_name=args.model
+            )
+            
+            print(f"\n📊 {args.k_folds}-Fold Cross-Validation Complete!")
+            for i, fold in enumerate(cv_results['folds'], 1):
+                print(f"  Fold {i}: {fold['baseline_score']['average_score']:.3f} -> {fold['optimized_score']['average_score']:.3f}")
+            print(f"Baseline Score: {cv_results['baseline_mean']:.3f} ± {cv_results['baseline_std']:.3f}")
+            print(f"Optimized Score: {cv_results['optimized_mean']:.3f} ± {cv_results['optimized_std']:.3f}")
+            print(f"Mean Improvement: {cv_results['improvement_mean']:.3f}")
+            print(f"Cost: ${cv_results['total_cost_usd']:.2f}")
+            
         elif args.train_csv and args.val_csv:
             # Training mode
             # Load data from CSV files
@@ -438,7 +615,7 @@ if __name__ == "__main__":
             logger.info("Using standard train/val split")
             
             results = run_optimization_pipeline(
-                retriever=PineconeRetriever(),
+                retriever=PineconeRetriever(adaptive_top_k=settings.retriever_adaptive_top_k),
                 training_data=train_data,
                 validation_data=val_data,
                 save_path=args.save_path,
@@ -458,5 +635,5 @@ if __name__ == "__main__":
             parser.print_help()
         
     except Exception as e:
-        logger.error(f"Operation failed: {e}")
+        logger.error("Operation failed: %s", e)
         raise
\ No newline at end of file
@@ -0,0 +1,87 @@
+import os
+
+# The app creates an OpenAI client at startup, which requires a key to be set
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import dspy
+import pytest
+
+import app.services.retriever as retriever_module
+from app.core.config import settings
+from app.services.rag_service import RAGService
+from app.services.retriever import enable_retrieval_cache
+from app.services.schemas import SearchResult
+
+MOCK_COMPLETION = (
+    "[[ ## reasoning ## ]]\nbecause\n\n"
+    "[[ ## response ## ]]\nHello there friend, how are you?\n\n"
+    "[[ ## completed ## ]]"
+)
+
+
+class FakeRetriever:
+    """Stands in for PineconeRetriever; returns one fixed passage, or none when `empty` is set"""
+
+    def __init__(self, k=3, threshold=0.7, **kwargs):
+        self.empty = False
+        self.effective_top_k = k
+        self.threshold = threshold
+
+    def warm_up(self) -> None:
+        pass
+
+    def forward(self, query, k=None, **kwargs):
+        if self.empty:
+            return dspy.Prediction(passages=(), results=())
+        result = SearchResult("1", 0.8, "Cards can be frozen from the app.", "cards")
+        return dspy.Prediction(passages=(result.text,), results=(result,))
+
+    async def aforward(self, query, k=None, **kwargs):
+        return self.forward(query, k)
+
+
+@pytest.fixture
+def rag_service(monkeypatch) -> RAGService:
+    """A RAGService wired to a fake retriever and a stub LM that streams MOCK_COMPLETION"""
+    monkeypatch.setattr(retriever_module, "PineconeRetriever", FakeRetriever)
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    service = RAGService()
+    service.lm = dspy.LM("openai/gpt-4o-mini", mock_response=MOCK_COMPLETION, cache=False, api_key="test")
+    dspy.configure(lm=service.lm)
+    return service
+
+
+PINECONE_HITS = {"result": {"hits": [
+    {"_id": "a", "_score": 0.9, "fields": {"text": "Cards can be frozen from the app.", "category": "cards"}},
+    {"_id": "b", "_score": 0.2, "fields": {"text": "Unrelated.", "category": "other"}},
+]}}
+
+
+class FakeIndex:
+    """Stands in for both the sync and async Pinecone index handles, counting searches"""
+
+    def __init__(self):
+        self.searches = 0
+        self.hits = PINECONE_HITS
+        self.top_k = None
+
+    def search(self, **kwargs):
+        self.searches += 1
+        self.top_k = kwargs["query"].top_k
+        return self.hits
+
+    async def asearch(self, **kwargs):
+        return self.search(**kwargs)
+
+
+@pytest.fixture
+def pinecone_index(monkeypatch) -> FakeIndex:
+    index = FakeIndex()
+    async_index = type("AsyncIndex", (), {"search": lambda self, **kwargs: index.asearch(**kwargs)})()
+    monkeypatch.setattr(retriever_module, "_resolve_host", lambda *args: "test-host")
+    monkeypatch.setattr(retriever_module, "_get_index", lambda *args: index)
+    monkeypatch.setattr(retriever_module, "_get_async_index", lambda *args: async_index)
+    monkeypatch.setattr(retriever_module, "_disk_cache", None)
+    yield index
+    enable_retrieval_cache(0)
+    retriever_module._retrieval_cache.clear()
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.core.config import settings
+
+
+class CachedOnlyService:
+    """Loaded service stub whose response cache is empty"""
+
+    async def aclose(self):
+        pass
+
+    def has_cached_response(self, message, conversation_history=None):
+        return False
+
+    async def stream_response(self, message, conversation_history=None):
+        yield "event: error\ndata: {}\n\n"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "get_rag_service", lambda *args: CachedOnlyService())
+    with TestClient(main.app) as client:
+        while not main.app.state.rag_service_task.done():
+            time.sleep(0.01)
+        yield client
+
+
+def test_stream_endpoint_is_documented_as_event_stream(client):
+    operation = client.get("/openapi.json").json()["paths"]["/api/v1/chat/stream"]["post"]
+
+    assert list(operation["responses"]["200"]["content"]) == ["text/event-stream"]
+
+
+def test_stream_replay_miss_is_a_503(client, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "replay")
+
+    response = client.post("/api/v1/chat/stream", json={"message": "hi"})
+
+    assert response.status_code == 503
+    assert response.json()["detail"] == "No cached response available for this request."
+
+
+def test_stream_opens_outside_replay_mode(client, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "enabled")
+
+    response = client.post("/api/v1/chat/stream", json={"message": "hi"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
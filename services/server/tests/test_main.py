@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+
+
+def wait_for_service_load(timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not main.app.state.rag_service_task.done():
+        assert time.monotonic() < deadline, "RAG service load did not finish"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def failing_service(monkeypatch):
+    def fail(*args):
+        raise RuntimeError("pinecone unreachable")
+
+    monkeypatch.setattr(main, "get_rag_service", fail)
+
+
+def test_failed_service_load_is_logged_and_reported(failing_service, caplog):
+    with caplog.at_level(logging.ERROR, logger="app.main"), TestClient(main.app) as client:
+        wait_for_service_load()
+
+        assert client.get("/health").status_code == 200
+        assert client.get("/ready").json() == {"status": "failed"}
+        assert client.get("/ready").status_code == 503
+        assert client.post("/api/v1/chat", json={"message": "hi"}).status_code == 503
+        assert client.post("/api/v1/chat/stream", json={"message": "hi"}).status_code == 503
+
+    assert "RAG service failed to initialize" in caplog.text
+    assert "pinecone unreachable" in caplog.text
+
+
+def test_requests_get_503_while_service_is_loading(monkeypatch):
+    release = threading.Event()
+
+    def slow(*args):
+        release.wait(timeout=10)
+        raise RuntimeError("not needed")
+
+    monkeypatch.setattr(main, "get_rag_service", slow)
+
+    with TestClient(main.app) as client:
+        try:
+            response = client.post("/api/v1/chat", json={"message": "hi"})
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "5"
+            assert client.get("/ready").json() == {"status": "starting"}
+        finally:
+            release.set()
+
+
+def test_ready_once_service_has_loaded(monkeypatch):
+    class Service:
+        async def aclose(self):
+            pass
+
+    monkeypatch.setattr(main, "get_rag_service", lambda *args: Service())
+
+    with TestClient(main.app) as client:
+        wait_for_service_load()
+        response = client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
@@ -0,0 +1,196 @@
+import threading
+
+import dspy
+import pytest
+
+import optimizer.optimizer as optimizer_module
+from app.services.rag import RAG
+from app.services.retriever import PineconeRetriever
+from optimizer.optimizer import RAGOptimizer, run_optimization_pipeline
+
+TRAINING_DATA = [("How do I freeze my card?", "From the app."), ("What is the fee?", "There is none.")]
+VALIDATION_DATA = [("Can I unfreeze my card?", "Yes."), ("Where is my statement?", "In the app.")]
+
+
+class AppendingHistory(list):
+    """A history list that gains an entry right after it is sliced, like a concurrent evaluator thread"""
+
+    def __getitem__(self, index):
+        items = super().__getitem__(index)
+        if isinstance(index, slice) and not getattr(self, "appended", False):
+            self.appended = True
+            self.append({"cost": 4.0})
+        return items
+
+
+def make_optimizer(history) -> RAGOptimizer:
+    optimizer = RAGOptimizer.__new__(RAGOptimizer)
+    optimizer.lm = type("LM", (), {"history": history})()
+    optimizer._cost_sum = 0.0
+    optimizer._cost_last = None
+    optimizer._cost_lock = threading.Lock()
+    return optimizer
+
+
+def test_get_cost_sums_only_new_entries():
+    history = [{"cost": 1.0}, {"cost": None}]
+    optimizer = make_optimizer(history)
+
+    assert optimizer.get_cost() == 1.0
+    history.append({"cost": 2.0})
+    assert optimizer.get_cost() == 3.0
+    assert optimizer.get_cost() == 3.0
+
+
+def test_get_cost_survives_history_eviction():
+    history = [{"cost": 1.0}, {"cost": 2.0}]
+    optimizer = make_optimizer(history)
+    assert optimizer.get_cost() == 3.0
+
+    history.pop(0)
+    history.append({"cost": 4.0})
+
+    assert optimizer.get_cost() == 7.0
+
+
+def test_entry_appended_during_get_cost_is_counted_later():
+    history = AppendingHistory([{"cost": 1.0}])
+    optimizer = make_optimizer(history)
+
+    assert optimizer.get_cost() == 1.0
+    assert optimizer.get_cost() == 5.0
+
+
+class FakeOptimizer:
+    """Replaces RAGOptimizer in run_optimization_pipeline; evaluations retrieve every question"""
+
+    fail_optimize = False
+
+    def __init__(self, retriever, **kwargs):
+        self.retriever = retriever
+        self.prefetch_flags = []
+
+    def prepare_examples(self, questions, responses):
+        return [dspy.Example(question=q, response=r).with_inputs("question") for q, r in zip(questions, responses)]
+
+    def create_module(self):
+        return RAG(self.retriever)
+
+    def evaluate(self, module, dataset, prefetch=True):
+        self.prefetch_flags.append(prefetch)
+        for example in dataset:
+            module.retrieve(example.question)
+        return {"average_score": 0.5}
+
+    def optimize(self, module, trainset):
+        if self.fail_optimize:
+            raise RuntimeError("bootstrap failed")
+        return module
+
+    def get_cost(self):
+        return 0.0
+
+
+@pytest.fixture
+def fake_optimizer(monkeypatch):
+    monkeypatch.setattr(optimizer_module, "RAGOptimizer", FakeOptimizer)
+    monkeypatch.setattr(FakeOptimizer, "fail_optimize", False)
+    return FakeOptimizer
+
+
+def test_pipeline_retrieves_the_eval_set_once(pinecone_index, fake_optimizer, monkeypatch):
+    retriever = PineconeRetriever()
+    optimizers = []
+    monkeypatch.setattr(
+        optimizer_module, "RAGOptimizer", lambda **kwargs: optimizers.append(FakeOptimizer(**kwargs)) or optimizers[-1]
+    )
+
+    run_optimization_pipeline(retriever, TRAINING_DATA, VALIDATION_DATA)
+
+    # pin() fetched each validation question once; both evaluations were served from it
+    assert pinecone_index.searches == len(VALIDATION_DATA)
+    assert optimizers[0].prefetch_flags == [False, False]
+    assert retriever._session_cache == {}
+
+
+def test_pipeline_unpins_when_optimization_fails(pinecone_index, fake_optimizer):
+    fake_optimizer.fail_optimize = True
+    retriever = PineconeRetriever()
+
+    with pytest.raises(RuntimeError, match="bootstrap failed"):
+        run_optimization_pipeline(retriever, TRAINING_DATA, VALIDATION_DATA)
+
+    assert retriever._session_cache == {}
+    assert retriever._pinning is False
+
+
+def fold_result(baseline: float, optimized: float, cost: float = 0.5):
+    return {
+        'baseline_score': {'average_score': baseline},
+        'optimized_score': {'average_score': optimized},
+        'improvement': optimized - baseline,
+        'total_cost_usd': cost,
+    }
+
+
+def test_kfold_splits_partition_the_data_including_remainder_rows():
+    data = [(f"q{i}", f"a{i}") for i in range(11)]
+
+    splits = optimizer_module._kfold_splits(data, 3)
+
+    validation_folds = [validation for _, validation in splits]
+    assert [len(fold) for fold in validation_folds] == [4, 4, 3]
+    assert sorted(pair for fold in validation_folds for pair in fold) == sorted(data)
+    for training, validation in splits:
+        assert not set(training) & set(validation)
+        assert sorted(training + validation) == sorted(data)
+
+
+def test_aggregate_fold_results():
+    results = optimizer_module._aggregate_fold_results(
+        [fold_result(0.4, 0.6), fold_result(0.6, 0.6), fold_result(0.5, 0.9)]
+    )
+
+    assert results['baseline_mean'] == pytest.approx(0.5)
+    assert results['baseline_std'] == pytest.approx(0.1)
+    assert results['optimized_mean'] == pytest.approx(0.7)
+    assert results['optimized_std'] == pytest.approx(0.17320508)
+    assert results['improvement_mean'] == pytest.approx(0.2)
+    assert results['total_cost_usd'] == pytest.approx(1.5)
+
+
+def test_aggregate_single_fold_has_zero_spread():
+    results = optimizer_module._aggregate_fold_results([fold_result(0.4, 0.6)])
+
+    assert results['baseline_std'] == 0.0
+    assert results['optimized_std'] == 0.0
+    assert results['improvement_mean'] == pytest.approx(0.2)
+
+
+def test_kfold_cross_validation_runs_every_fold(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    def run_fold(training_data, validation_data, model_name):
+        calls.append((len(training_data), len(validation_data), model_name))
+        return fold_result(0.5, 0.5 + len(validation_data) / 100)
+
+    # Folds normally run in spawned processes, which can't see a monkeypatched _run_fold
+    monkeypatch.setattr(optimizer_module, "_run_fold", run_fold)
+    monkeypatch.setattr(
+        optimizer_module, "ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)
+    )
+    data = [(f"q{i}", f"a{i}") for i in range(11)]
+
+    results = optimizer_module.run_kfold_cross_validation(data, k_folds=3, model_name="test-model")
+
+    assert sorted(calls) == [(7, 4, "test-model"), (7, 4, "test-model"), (8, 3, "test-model")]
+    assert len(results['folds']) == 3
+    assert results['optimized_mean'] == pytest.approx(0.5 + 11 / 300)
+
+
+@pytest.mark.parametrize("data, k_folds", [([("q", "a")] * 5, 1), ([("q", "a")] * 2, 3)])
+def test_kfold_cross_validation_rejects_unusable_fold_counts(data, k_folds):
+    with pytest.raises(ValueError):
+        optimizer_module.run_kfold_cross_validation(data, k_folds=k_folds)
@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from app.core.config import settings
+
+
+async def collect(stream):
+    return [event async for event in stream]
+
+
+def events_of(events, name):
+    return [json.loads(e.split("data: ", 1)[1]) for e in events if e.startswith(f"event: {name}\n")]
+
+
+@pytest.mark.asyncio
+async def test_stream_response_streams_tokens_on_every_call(rag_service, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "disabled")
+
+    for question in ("How do I freeze my card?", "Can I unfreeze it later?"):
+        events = await collect(rag_service.stream_response(question))
+
+        tokens = events_of(events, "token")
+        assert tokens, f"no token events for {question!r}"
+        assert "".join(t["content"] for t in tokens).strip() == "Hello there friend, how are you?"
+        (metadata,) = events_of(events, "metadata")
+        assert metadata["status"] == "success"
+
+
+@pytest.mark.asyncio
+async def test_responses_are_cached_when_contexts_were_retrieved(rag_service, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "enabled")
+
+    first = await rag_service.generate_response("How do I freeze my card?")
+    second = await rag_service.generate_response("How do I freeze my card?")
+
+    assert first.status == "success"
+    assert second is first
+
+
+@pytest.mark.asyncio
+async def test_answers_without_contexts_are_not_cached(rag_service, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "enabled")
+    # The retriever returns an empty prediction when Pinecone fails
+    rag_service.retriever.empty = True
+
+    response = await rag_service.generate_response("How do I freeze my card?")
+    await collect(rag_service.stream_response("Can I unfreeze it later?"))
+
+    assert response.status == "success"
+    assert response.contexts == []
+    assert len(rag_service._response_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_generate_response_budgets_for_retrieved_context(rag_service, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "disabled")
+    requested = []
+
+    async def acquire(estimated_tokens=0):
+        requested.append(estimated_tokens)
+        return estimated_tokens
+
+    monkeypatch.setattr(rag_service.rate_limiter, "acquire", acquire)
+
+    await rag_service.generate_response("How do I freeze my card?")
+    await collect(rag_service.stream_response("How do I freeze my card?"))
+
+    context = "Cards can be frozen from the app."
+    assert requested[0] >= len(rag_service._rules + context) // 4
+    assert requested[0] == requested[1]
+    # A typical completion is reserved, not the model's whole max_tokens
+    assert requested[0] < len(rag_service._rules + context) // 4 + rag_service.lm.kwargs["max_tokens"]
+
+
+@pytest.mark.asyncio
+async def test_has_cached_response_reflects_the_response_cache(rag_service, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "enabled")
+
+    assert not rag_service.has_cached_response("How do I freeze my card?")
+    await rag_service.generate_response("How do I freeze my card?")
+    assert rag_service.has_cached_response("How do I freeze my card?")
+
+
+@pytest.mark.asyncio
+async def test_response_cache_is_keyed_on_the_effective_top_k(rag_service, monkeypatch):
+    monkeypatch.setattr(settings, "cache_mode", "enabled")
+
+    await rag_service.generate_response("How do I freeze my card?")
+    rag_service.retriever.effective_top_k = 1
+
+    assert not rag_service.has_cached_response("How do I freeze my card?")
+
+
+def test_server_retriever_never_adapts_top_k(pinecone_index, monkeypatch):
+    from app.services.rag_service import RAGService
+
+    monkeypatch.setattr(settings, "retriever_adaptive_top_k", True)
+
+    assert not RAGService().retriever.adaptive_top_k
+
+
+@pytest.mark.asyncio
+async def test_budget_is_settled_against_actual_usage(rag_service, monkeypatch):
+    import dspy
+
+    monkeypatch.setattr(settings, "cache_mode", "disabled")
+    # Turn on an in-memory LM cache for this test only
+    monkeypatch.setattr(dspy, "cache", dspy.cache)
+    dspy.configure_cache(enable_disk_cache=False, enable_memory_cache=True)
+    rag_service.lm = dspy.LM(
+        "openai/gpt-4o-mini", mock_response=rag_service.lm.kwargs["mock_response"], cache=True, api_key="test"
+    )
+    dspy.configure(lm=rag_service.lm)
+    released = []
+
+    async def acquire(estimated_tokens=0):
+        return estimated_tokens
+
+    monkeypatch.setattr(rag_service.rate_limiter, "acquire", acquire)
+    monkeypatch.setattr(rag_service.rate_limiter, "release", lambda tokens=0, requests=0: released.append((tokens, requests)))
+
+    question = "How do I settle my rate-limit budget?"
+    first = await rag_service.generate_response(question)
+    # The identical call is served from the LM cache
+    second = await rag_service.generate_response(question)
+
+    assert first.status == second.status == "success"
+    (refund, requests), (cache_hit_refund, cache_hit_requests) = released
+    # The stub LM reports 30 tokens used; the cache hit gives back the whole reservation
+    assert (cache_hit_refund - refund, requests) == (30, 0)
+    assert cache_hit_requests == 1
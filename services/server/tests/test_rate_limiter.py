@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+import app.services.rate_limiter as rate_limiter
+from app.services.rate_limiter import AsyncTokenBucket, estimate_tokens
+
+
+class FakeClock:
+    """Replaces time.monotonic in the limiter; sleeping advances it instead of waiting"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        clock.sleeps.append(delay)
+        clock.now += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", fake_sleep)
+    return clock
+
+
+def test_estimate_tokens_adds_completion_budget():
+    assert estimate_tokens("x" * 400, max_tokens=100) == 200
+
+
+@pytest.mark.asyncio
+async def test_disabled_bucket_never_waits(clock):
+    bucket = AsyncTokenBucket()
+
+    for _ in range(1000):
+        await bucket.acquire(10_000)
+
+    assert clock.sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_requests_wait_once_rpm_is_spent(clock):
+    bucket = AsyncTokenBucket(rpm=60)
+
+    for _ in range(60):
+        await bucket.acquire()
+    assert clock.sleeps == []
+
+    await bucket.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+@pytest.mark.asyncio
+async def test_tokens_wait_for_refill(clock):
+    bucket = AsyncTokenBucket(tpm=600)
+
+    await bucket.acquire(600)
+    await bucket.acquire(100)
+
+    # 100 tokens at 10 tokens/second
+    assert clock.sleeps == [pytest.approx(10.0)]
+
+
+@pytest.mark.asyncio
+async def test_bucket_refills_while_idle(clock):
+    bucket = AsyncTokenBucket(tpm=600)
+
+    await bucket.acquire(600)
+    clock.now += 30
+    await bucket.acquire(300)
+
+    assert clock.sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_refill_is_capped_at_capacity(clock):
+    bucket = AsyncTokenBucket(tpm=600)
+
+    clock.now += 3600
+    await bucket.acquire(600)
+    await bucket.acquire(60)
+
+    assert clock.sleeps == [pytest.approx(6.0)]
+
+
+@pytest.mark.asyncio
+async def test_oversized_estimate_waits_for_a_full_bucket_only(clock):
+    bucket = AsyncTokenBucket(tpm=100)
+
+    await bucket.acquire(50)
+    await bucket.acquire(10_000)
+
+    # Clamped to the 100-token capacity: wait for the missing 50 at 100/60 tokens per second
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_are_served_in_turn(clock):
+    bucket = AsyncTokenBucket(rpm=60)
+    for _ in range(60):
+        await bucket.acquire()
+
+    await asyncio.gather(*(bucket.acquire() for _ in range(3)))
+
+    assert sum(clock.sleeps) == pytest.approx(3.0)
+
+
+@pytest.mark.asyncio
+async def test_waiting_caller_does_not_hold_the_lock(clock, monkeypatch):
+    bucket = AsyncTokenBucket(tpm=600)
+    await bucket.acquire(600)
+
+    sleeping = asyncio.Event()
+
+    async def blocked_sleep(delay):
+        clock.sleeps.append(delay)
+        sleeping.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", blocked_sleep)
+
+    waiting = asyncio.create_task(bucket.acquire(600))
+    await sleeping.wait()
+    assert clock.sleeps == [pytest.approx(60.0)]
+
+    # A caller whose budget is available goes straight through
+    await asyncio.wait_for(bucket.acquire(0), timeout=1)
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+
+@pytest.mark.asyncio
+async def test_release_refunds_unused_tokens(clock):
+    bucket = AsyncTokenBucket(tpm=600)
+
+    reserved = await bucket.acquire(600)
+    bucket.release(reserved - 100)
+    await bucket.acquire(500)
+
+    assert reserved == 600
+    assert clock.sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_release_charges_overruns(clock):
+    bucket = AsyncTokenBucket(tpm=600)
+
+    reserved = await bucket.acquire(100)
+    bucket.release(reserved - 700)
+    await bucket.acquire(100)
+
+    # The bucket is 200 tokens short after the overrun: 200 tokens at 10 tokens/second
+    assert clock.sleeps == [pytest.approx(20.0)]
+
+
+@pytest.mark.asyncio
+async def test_release_returns_requests(clock):
+    bucket = AsyncTokenBucket(rpm=1)
+
+    await bucket.acquire()
+    bucket.release(requests=1)
+    await bucket.acquire()
+
+    assert clock.sleeps == []
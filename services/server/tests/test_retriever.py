@@ -0,0 +1,131 @@
+import dspy
+
+import app.services.retriever as retriever_module
+from app.core.config import settings
+from app.services.retriever import PineconeRetriever, enable_disk_retrieval_cache, enable_retrieval_cache
+from app.services.schemas import SearchResult
+
+
+def test_results_below_threshold_are_dropped(pinecone_index):
+    prediction = PineconeRetriever(k=2, threshold=0.5)("How do I freeze my card?")
+
+    assert isinstance(prediction, dspy.Prediction)
+    assert prediction.passages == ("Cards can be frozen from the app.",)
+    assert [r.id for r in prediction.results] == ["a"]
+
+
+def test_retrieval_cache_is_off_by_default(pinecone_index):
+    retriever = PineconeRetriever()
+
+    retriever("How do I freeze my card?")
+    retriever("How do I freeze my card?")
+
+    assert pinecone_index.searches == 2
+
+
+def test_enabled_cache_keeps_query_case_but_collapses_whitespace(pinecone_index):
+    enable_retrieval_cache(16)
+    retriever = PineconeRetriever()
+
+    retriever("How do I freeze my card?")
+    retriever("  How do I   freeze my card? ")
+    assert pinecone_index.searches == 1
+
+    retriever("how do i freeze my card?")
+    assert pinecone_index.searches == 2
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = retriever_module._DiskRetrievalCache(str(tmp_path), ttl_seconds=60)
+    result = SearchResult("a", 0.9, "Cards can be frozen from the app.", "cards")
+    key = ("index", "__default__", 3, 0.7, "How do I freeze my card?")
+
+    assert cache.get(key) is None
+    cache.put(key, dspy.Prediction(passages=(result.text,), results=(result,)))
+
+    # A second handle on the same directory stands in for a later process
+    restored = retriever_module._DiskRetrievalCache(str(tmp_path), ttl_seconds=60).get(key)
+    assert restored.passages == (result.text,)
+    assert restored.results == (result,)
+    assert cache.get(key[:-1] + ("how do I freeze my card?",)) is None
+
+
+def test_disk_cache_is_only_enabled_explicitly(pinecone_index, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "pinecone_retriever_cache", True)
+    retriever = PineconeRetriever()
+
+    retriever("How do I freeze my card?")
+
+    assert retriever_module._disk_cache is None
+    assert not any(tmp_path.iterdir())
+
+
+def test_lookup_order_is_session_then_lru_then_disk(pinecone_index, tmp_path):
+    enable_retrieval_cache(16)
+    enable_disk_retrieval_cache(str(tmp_path), ttl_seconds=60)
+    retriever = PineconeRetriever()
+    query = "How do I freeze my card?"
+    key = retriever._cache_key(query, retriever.k)
+
+    # A miss everywhere searches Pinecone and writes through to the LRU and disk
+    retriever(query)
+    assert pinecone_index.searches == 1
+
+    # Disk hits are served without a search and promoted into the LRU
+    retriever_module._retrieval_cache.clear()
+    assert retriever(query).passages == ("Cards can be frozen from the app.",)
+    assert pinecone_index.searches == 1
+    assert retriever_module._retrieval_cache.get(key) is not None
+
+    # The LRU is consulted before disk
+    retriever_module._retrieval_cache.put(key, dspy.Prediction(passages=("from lru",), results=()))
+    assert retriever(query).passages == ("from lru",)
+
+    # Pinned session entries are consulted before the LRU
+    retriever._session_cache[key] = dspy.Prediction(passages=("from session",), results=())
+    assert retriever(query).passages == ("from session",)
+    assert pinecone_index.searches == 1
+
+
+def test_optimizer_enables_the_disk_cache_when_configured(pinecone_index, tmp_path, monkeypatch):
+    from optimizer.optimizer import RAGOptimizer
+
+    monkeypatch.setattr(settings, "pinecone_retriever_cache", True)
+    monkeypatch.setattr(settings, "pinecone_retriever_cache_dir", str(tmp_path))
+
+    RAGOptimizer(retriever=PineconeRetriever())
+
+    assert retriever_module._disk_cache is not None
+    assert retriever_module._disk_cache.directory == str(tmp_path)
+
+
+def test_adaptive_top_k_tracks_yield_without_exceeding_k(pinecone_index):
+    retriever = PineconeRetriever(k=5, adaptive_top_k=True)
+    assert retriever.effective_top_k == 5
+
+    # Off-topic queries keep nothing, so the estimate shrinks toward a single hit
+    pinecone_index.hits = {"result": {"hits": []}}
+    for i in range(10):
+        retriever(f"off-topic question {i}")
+    assert retriever.effective_top_k == 1
+    retriever("another off-topic question")
+    assert pinecone_index.top_k == 1
+
+    # Queries whose hits all clear the threshold grow it back, capped at k
+    pinecone_index.hits = {"result": {"hits": [
+        {"_id": str(i), "_score": 0.9, "fields": {"text": f"Passage {i}.", "category": "cards"}}
+        for i in range(5)
+    ]}}
+    for i in range(20):
+        retriever(f"on-topic question {i}")
+        assert pinecone_index.top_k <= 5
+    assert retriever.effective_top_k == 5
+
+
+def test_adaptive_top_k_is_not_persisted_with_saved_state(pinecone_index):
+    retriever = PineconeRetriever(k=5, adaptive_top_k=True)
+    restored = PineconeRetriever(k=5)
+
+    restored.load_state(retriever.dump_state())
+
+    assert not restored.adaptive_top_k